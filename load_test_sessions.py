@@ -0,0 +1,237 @@
+"""Local load test for the /session WebSocket channel.
+
+Opens N concurrent kiosk sessions against a running server, walks each one
+through a full registration script (declining the final submit so nothing is
+written to Excel), keeps them heartbeating, and reports how many sessions
+stayed up along with per-turn latency.
+
+    python server.py &
+    python load_test_sessions.py --sessions 200 --hold 30
+
+With --tts every turn also waits for the pushed audio (audio_start, binary
+chunks, audio_end), so the Polly admission limits are part of the measurement.
+--stub-tts serves the app in-process with a fake Polly that sleeps and returns
+fixed-size MP3 bytes, for measuring the audio path without AWS credentials:
+
+    python load_test_sessions.py --stub-tts --sessions 200
+
+Scripted sessions talk far faster than a visitor, so in stub mode the TTS_*
+admission limits default to values the script cannot hit; export TTS_* to
+measure a real quota instead, or slow the script down with --pace. Audio is
+reported as synthesized vs cached fallback so the two are never mixed.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+
+from simple_websocket import Client, ConnectionClosed
+
+SCRIPT = [
+    'good', 'john smith', 'yes', 'operisoft', 'yes',
+    'john at gmail dot com', 'yes', '9876543210', 'yes',
+    'india', 'yes', 'no'
+]
+
+
+class StubAudioStream(io.BytesIO):
+    def iter_chunks(self, chunk_size):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class StubPolly:
+    """Stands in for the Polly client: fixed latency, fixed-size audio."""
+
+    def __init__(self, latency, audio_bytes):
+        self.latency = latency
+        self.audio = b'\xff' * audio_bytes
+
+    def synthesize_speech(self, **kwargs):
+        time.sleep(self.latency)
+        return {'AudioStream': StubAudioStream(self.audio)}
+
+
+# Stub Polly has no quota; explicit TTS_* environment variables still win
+STUB_TTS_LIMITS = {
+    'TTS_CLIENT_RATE': '1000', 'TTS_CLIENT_BURST': '1000',
+    'TTS_GLOBAL_RATE': '100000', 'TTS_GLOBAL_BURST': '100000',
+    'TTS_MAX_CONCURRENCY': '1000'
+}
+
+
+def serve_with_stub(port, latency, audio_bytes):
+    for name, value in STUB_TTS_LIMITS.items():
+        os.environ.setdefault(name, value)
+
+    from werkzeug.serving import make_server
+    import server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server.polly_client = StubPolly(latency, audio_bytes)
+    server.speech_admission.warm_fallback()
+    httpd = make_server('127.0.0.1', port, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f'ws://127.0.0.1:{port}/session'
+
+
+def receive_audio(ws, record):
+    """Consume audio_start, binary chunks and audio_end/audio_error for one turn.
+
+    Returns 'synthesized', 'fallback' or 'error'.
+    """
+    kind = 'synthesized'
+    while True:
+        frame = ws.receive(timeout=30)
+        if frame is None:
+            raise RuntimeError('Timed out waiting for audio')
+        if isinstance(frame, bytes):
+            record['audio_chunks'][kind] += 1
+            record['audio_bytes'][kind] += len(frame)
+            continue
+        message = json.loads(frame)
+        if message.get('type') == 'audio_start' and message.get('fallback'):
+            kind = 'fallback'
+        elif message.get('type') == 'audio_end':
+            return kind
+        elif message.get('type') == 'audio_error':
+            return 'error'
+
+
+def run_session(url, tts, pace, hold, heartbeat, barrier, results, lock):
+    record = {
+        'connected': False, 'completed': False, 'latencies': [],
+        'audio_latencies': {'synthesized': [], 'fallback': [], 'error': []},
+        'audio_chunks': {'synthesized': 0, 'fallback': 0},
+        'audio_bytes': {'synthesized': 0, 'fallback': 0},
+        'error': None
+    }
+    ws = None
+    try:
+        ws = Client.connect(url)
+        ws.send(json.dumps({'type': 'hello', 'tts': tts}))
+        session = json.loads(ws.receive(timeout=10))
+        record['connected'] = session.get('type') == 'session'
+        turn = session.get('turn', 0)
+
+        # Start all conversations together so the server sees peak concurrency
+        barrier.wait()
+
+        for index, utterance in enumerate(SCRIPT):
+            if index and pace:
+                time.sleep(pace)
+            start = time.perf_counter()
+            ws.send(json.dumps({'type': 'transcript', 'text': utterance, 'final': True, 'turn': turn}))
+            reply = json.loads(ws.receive(timeout=10))
+            record['latencies'].append(time.perf_counter() - start)
+            turn = reply['turn']
+            if tts:
+                kind = receive_audio(ws, record)
+                record['audio_latencies'][kind].append(time.perf_counter() - start)
+        record['completed'] = True
+
+        deadline = time.time() + hold
+        while time.time() < deadline:
+            time.sleep(heartbeat)
+            ws.send(json.dumps({'type': 'ping'}))
+            if json.loads(ws.receive(timeout=10)).get('type') != 'pong':
+                raise RuntimeError('Heartbeat not answered')
+    except (ConnectionClosed, RuntimeError, TypeError, ValueError, KeyError, OSError) as e:
+        record['error'] = str(e) or type(e).__name__
+    except threading.BrokenBarrierError:
+        record['error'] = 'Barrier broken'
+    finally:
+        if ws:
+            ws.close()
+        with lock:
+            results.append(record)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return None
+    return {
+        'p50': round(statistics.median(latencies) * 1000, 2),
+        'p95': round(percentile(latencies, 0.95) * 1000, 2),
+        'max': round(max(latencies) * 1000, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the /session WebSocket channel')
+    parser.add_argument('--url', default='ws://127.0.0.1:5000/session')
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--hold', type=float, default=10, help='Seconds to keep sessions open after the script')
+    parser.add_argument('--heartbeat', type=float, default=5, help='Seconds between pings while holding')
+    parser.add_argument('--tts', action='store_true', help='Request and wait for pushed audio on every turn')
+    parser.add_argument('--pace', type=float, default=0, help='Seconds to pause between turns, like a visitor would')
+    parser.add_argument('--stub-tts', action='store_true', help='Serve in-process with a fake Polly (implies --tts)')
+    parser.add_argument('--stub-port', type=int, default=5055)
+    parser.add_argument('--stub-latency', type=float, default=0.25, help='Fake Polly latency in seconds')
+    parser.add_argument('--stub-audio-bytes', type=int, default=48 * 1024, help='Fake MP3 size per prompt')
+    args = parser.parse_args()
+
+    url = args.url
+    tts = args.tts or args.stub_tts
+    if args.stub_tts:
+        url = serve_with_stub(args.stub_port, args.stub_latency, args.stub_audio_bytes)
+
+    results = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.sessions, timeout=60)
+    threads = [
+        threading.Thread(target=run_session, args=(url, tts, args.pace, args.hold, args.heartbeat, barrier, results, lock), daemon=True)
+        for _ in range(args.sessions)
+    ]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for record in results for latency in record['latencies']]
+    errors = [record['error'] for record in results if record['error']]
+    summary = {
+        'sessions_requested': args.sessions,
+        'sessions_connected': sum(record['connected'] for record in results),
+        'sessions_completed': sum(record['completed'] and not record['error'] for record in results),
+        'errors': len(errors),
+        'sample_errors': errors[:5],
+        'turns': len(latencies),
+        'elapsed_seconds': round(elapsed, 2),
+        'turn_latency_ms': latency_summary(latencies)
+    }
+    if tts:
+        summary['audio'] = {}
+        for kind in ('synthesized', 'fallback', 'error'):
+            kind_latencies = [latency for record in results for latency in record['audio_latencies'][kind]]
+            summary['audio'][kind] = {
+                'turns': len(kind_latencies),
+                'turn_to_audio_end_ms': latency_summary(kind_latencies)
+            }
+            if kind != 'error':
+                summary['audio'][kind]['chunks'] = sum(record['audio_chunks'][kind] for record in results)
+                summary['audio'][kind]['megabytes'] = round(
+                    sum(record['audio_bytes'][kind] for record in results) / 1e6, 2
+                )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Replay recorded utterances through VoiceBotManager offline.
+
+Input is JSONL, one record per line:
+    {"conversation_state": "collect_email", "user_data": {...},
+     "user_input": "john at gmail dot com", "current_field": "email",
+     "awaiting_confirmation": false,
+     "expected": {"new_state": "collect_email", "updated_data": {"email": "john@gmail.com"}}}
+
+Results are written as JSONL (one per input record) and aggregate
+accuracy/throughput stats are printed to stderr.
+"""
+import argparse
+import json
+import sys
+
+from server import parse_jsonl, run_conversation_batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded utterances through the dialogue logic')
+    parser.add_argument('input', help='JSONL file of records, or - for stdin')
+    parser.add_argument('-o', '--output', default='-', help='JSONL results file (default: stdout)')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Process pool size (default: CPU count)')
+    parser.add_argument('--stats', help='Also write aggregate stats as JSON to this file')
+    args = parser.parse_args()
+
+    try:
+        if args.input == '-':
+            records = parse_jsonl(sys.stdin)
+        else:
+            with open(args.input, encoding='utf-8') as f:
+                records = parse_jsonl(f)
+    except ValueError as e:
+        parser.error(str(e))
+
+    results, stats = run_conversation_batch(records, workers=args.workers)
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        for result in results:
+            out.write(json.dumps(result) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.stats:
+        with open(args.stats, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, indent=2)
+    print(json.dumps(stats, indent=2), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
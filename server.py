@@ -1,16 +1,27 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
 import boto3
 import base64
 import json
 import pandas as pd
 import os
+from collections import Counter
 from datetime import datetime
 import re
 import logging
+import time
+import threading
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 
 app = Flask(__name__)
 CORS(app)
+# Protocol-level WebSocket pings keep idle kiosk connections from being dropped by proxies
+app.config['SOCK_SERVER_OPTIONS'] = {'ping_interval': 25}
+sock = Sock(app)
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -27,9 +38,117 @@ except Exception as e:
     bedrock_client = None
 
 EXCEL_FILE = 'aws_community_visitors.xlsx'
+SNAPSHOT_FILE = os.getenv('SNAPSHOT_FILE', 'aws_community_visitors.parquet')
+SNAPSHOT_INTERVAL_SECONDS = int(os.getenv('SNAPSHOT_INTERVAL_SECONDS', 60))
+
+class RegistrationStats:
+    """Incrementally maintained registration aggregates for dashboards.
+
+    Seeded once from the Excel file, then updated on every save, so /stats
+    never has to reopen the workbook. A background thread periodically
+    writes the collected rows as a Parquet snapshot.
+    """
+    
+    columns = ['name', 'company', 'email', 'phone', 'country', 'timestamp', 'event']
+    
+    def __init__(self, excel_file=EXCEL_FILE, snapshot_file=SNAPSHOT_FILE, interval=SNAPSHOT_INTERVAL_SECONDS):
+        self.excel_file = excel_file
+        self.snapshot_file = snapshot_file
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.total = 0
+        self.by_company = Counter()
+        self.by_country = Counter()
+        self.by_hour = Counter()
+        self.last_registration_at = None
+        self.rows = {column: [] for column in self.columns}
+        self.dirty = False
+        self.snapshot_enabled = True
+        self.last_snapshot_at = None
+        self.stop_event = threading.Event()
+    
+    def ensure_loaded(self):
+        with self.lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            if os.path.exists(self.excel_file):
+                try:
+                    # dtype=str keeps phone numbers as written ('+91...', no float suffix)
+                    for row in pd.read_excel(self.excel_file, dtype=str).fillna('').to_dict('records'):
+                        self.add(row)
+                    self.dirty = True
+                except Exception as e:
+                    logger.warning(f"Could not seed registration stats from Excel: {e}")
+        
+        if self.interval > 0:
+            threading.Thread(target=self.snapshot_loop, daemon=True).start()
+    
+    def record(self, user_data):
+        self.ensure_loaded()
+        with self.lock:
+            self.add(user_data)
+            self.dirty = True
+    
+    def add(self, row):
+        company = str(row.get('company', '')).strip() or 'Unknown'
+        country = str(row.get('country', '')).strip() or 'Unknown'
+        timestamp = str(row.get('timestamp', ''))
+        
+        self.total += 1
+        self.by_company[company] += 1
+        self.by_country[country] += 1
+        if timestamp:
+            # Bucket key 'YYYY-MM-DD HH:00' from the '%Y-%m-%d %H:%M:%S' save format
+            self.by_hour[timestamp[:13] + ':00'] += 1
+            self.last_registration_at = max(self.last_registration_at or timestamp, timestamp)
+        for column in self.columns:
+            self.rows[column].append(str(row.get(column, '')))
+    
+    def summary(self, top=None):
+        self.ensure_loaded()
+        with self.lock:
+            return {
+                'total': self.total,
+                'by_company': dict(self.by_company.most_common(top)),
+                'by_country': dict(self.by_country.most_common(top)),
+                'by_hour': dict(sorted(self.by_hour.items())),
+                'last_registration_at': self.last_registration_at,
+                'last_snapshot_at': self.last_snapshot_at
+            }
+    
+    def snapshot_loop(self):
+        while not self.stop_event.wait(self.interval):
+            self.write_snapshot()
+    
+    def write_snapshot(self):
+        with self.lock:
+            if not self.dirty or not self.snapshot_enabled:
+                return
+            df = pd.DataFrame({column: list(values) for column, values in self.rows.items()})
+            self.dirty = False
+        
+        try:
+            # Write-then-rename so readers never see a partial file
+            tmp_file = f"{self.snapshot_file}.tmp"
+            df.to_parquet(tmp_file, index=False)
+            os.replace(tmp_file, self.snapshot_file)
+            self.last_snapshot_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        except ImportError as e:
+            logger.warning(f"Parquet snapshots disabled (install pyarrow): {e}")
+            self.snapshot_enabled = False
+        except Exception as e:
+            logger.error(f"Error writing registration snapshot: {e}")
+            with self.lock:
+                self.dirty = True
+
+registration_stats = RegistrationStats()
 
 class VoiceBotManager:
-    def __init__(self):
+    def __init__(self, persist=True):
+        # Offline replay runs with persist=False so confirmations never touch the Excel file
+        self.persist = persist
         self.conversation_states = {
             'greeting': self.handle_greeting,
             'collect_name': self.handle_name_collection,
@@ -69,6 +188,30 @@ class VoiceBotManager:
             'singapore': '+65', 'malaysia': '+60', 'thailand': '+66', 'philippines': '+63',
             'indonesia': '+62', 'vietnam': '+84', 'south korea': '+82', 'taiwan': '+886'
         }
+        
+        # National number lengths used to decide when a spoken phone number is complete
+        self.phone_lengths = {
+            '+1': 10, '+91': 10, '+44': 10, '+61': 9, '+65': 8, '+971': 9,
+            '+966': 9, '+49': 11, '+33': 9, '+81': 10, '+86': 11, '+60': 9
+        }
+        
+        # Domain endings nothing else is spoken after; '.com', '.in', '.org' etc. can still
+        # grow into '.com.au' or '.info', so those wait for the final transcript
+        self.complete_email_suffixes = ('co.uk', 'co.in', 'com.au', 'com.sg', 'com.my', 'io', 'ai', 'dev')
+        
+        # Interim transcripts only commit on explicit affirmations; hedge-prone words
+        # like 'sure', 'ok' or 'fine' wait for the final transcript
+        self.interim_confirm_phrases = [
+            'yes', 'yeah', 'yep', 'yup', 'correct', 'exactly', 'absolutely', 'definitely',
+            'confirm', 'perfect', 'proceed', 'go ahead', 'that\'s right', 'sounds good', 'looks good'
+        ]
+        # Continuation words mean more is coming ('yeah but...', 'no wait'), so nothing commits
+        self.hedge_words = {
+            'but', 'wait', 'hold', 'actually', 'except', 'although', 'though', 'however',
+            'maybe', 'unless', 'hmm', 'um', 'uh', 'well', 'and', 'so', 'just'
+        }
+        self.positive_tokens = {token for phrase in self.positive_responses for token in phrase.split()}
+        self.negative_tokens = {token for phrase in self.negative_responses for token in phrase.split()}
     
     def process_conversation(self, user_input, state, user_data, current_field, awaiting_confirmation):
         handler = self.conversation_states.get(state, self.handle_greeting)
@@ -398,7 +541,8 @@ class VoiceBotManager:
     
     def handle_final_confirmation(self, user_input, user_data, current_field, awaiting_confirmation):
         if self.is_positive_response(user_input):
-            self.save_visitor_data(user_data)
+            if self.persist:
+                self.save_visitor_data(user_data)
             response = "Fantastic! Your information has been successfully submitted. Thank you for visiting Operisoft at the Community Day event. We'll be in touch soon!"
             return {
                 'bot_response': response,
@@ -426,6 +570,101 @@ class VoiceBotManager:
                 'awaiting_confirmation': False
             }
     
+    def process_manual_input(self, field, value, user_data):
+        if field and value.strip():
+            user_data[field] = value.strip()
+            
+            # Determine next field
+            field_order = ['name', 'company', 'email', 'phone', 'country']
+            current_index = field_order.index(field)
+            
+            if current_index < len(field_order) - 1:
+                next_field = field_order[current_index + 1]
+                response = f"Thank you! Now, what's your {next_field}?"
+                new_state = f'collect_{next_field}'
+            else:
+                summary = f"Perfect! Let me confirm: Name: {user_data['name']}, Company: {user_data['company']}, Email: {user_data['email']}, Phone: {user_data['phone']}. Should I submit this?"
+                response = summary
+                new_state = 'final_confirmation'
+                next_field = ''
+            
+            return {
+                'bot_response': response,
+                'new_state': new_state,
+                'updated_data': user_data,
+                'current_field': next_field,
+                'awaiting_confirmation': False
+            }
+        else:
+            return {
+                'bot_response': f'Please enter a valid {field}.',
+                'new_state': f'collect_{field}',
+                'updated_data': user_data,
+                'current_field': field,
+                'awaiting_confirmation': False
+            }
+    
+    def detect_intent(self, transcript, state, current_field, awaiting_confirmation):
+        """Classify an interim transcript; commit is True only when the decision cannot change."""
+        no_decision = {'intent': None, 'value': None, 'commit': False}
+        text = (transcript or '').strip()
+        if not text:
+            return no_decision
+        
+        if awaiting_confirmation or state == 'final_confirmation':
+            # Whole tokens only: substring matching would read 'looks' as 'ok' and 'know' as 'no'
+            tokens = re.findall(r"[a-z']+", text.lower())
+            positive = self.match_phrases(tokens, self.positive_responses)
+            negative = self.match_phrases(tokens, self.negative_responses)
+            last_token = tokens[-1] if tokens else ''
+            if self.hedge_words.intersection(tokens):
+                return no_decision
+            
+            # The final check against is_*_response keeps the committed turn consistent
+            # with what process_conversation will do with the same text
+            if (self.match_phrases(tokens, self.interim_confirm_phrases) and not negative
+                    and not self.is_word_prefix(last_token, self.negative_tokens)
+                    and self.is_positive_response(text)):
+                return {'intent': 'confirm', 'value': None, 'commit': True}
+            if (negative and not positive
+                    and not self.is_word_prefix(last_token, self.positive_tokens)
+                    and not self.is_positive_response(text)):
+                return {'intent': 'reject', 'value': None, 'commit': True}
+            return no_decision
+        
+        if state == 'collect_email':
+            email = self.extract_email(text)
+            if email and self.is_complete_email(email):
+                return {'intent': 'value', 'field': 'email', 'value': email, 'commit': True}
+        elif state == 'collect_phone':
+            phone = self.extract_phone(text)
+            if phone and self.validate_phone(phone) and self.is_complete_phone(phone):
+                return {'intent': 'value', 'field': 'phone', 'value': phone, 'commit': True}
+        
+        return no_decision
+    
+    def match_phrases(self, tokens, phrases):
+        joined = ' ' + ' '.join(tokens) + ' '
+        return [phrase for phrase in phrases if ' ' + phrase + ' ' in joined]
+    
+    def is_word_prefix(self, token, vocabulary):
+        """True while token could still be the start of a longer vocabulary word."""
+        return any(word != token and word.startswith(token) for word in vocabulary)
+    
+    def is_complete_email(self, email):
+        domain = email.rsplit('@', 1)[-1]
+        return any(domain.endswith('.' + suffix) for suffix in self.complete_email_suffixes)
+    
+    def is_complete_phone(self, phone):
+        # Country is asked after the phone, so bare digits have no known length yet
+        if not phone.startswith('+'):
+            return False
+        # Longest matching country code wins
+        for code in sorted(self.phone_lengths, key=len, reverse=True):
+            if phone.startswith(code):
+                return len(phone) - len(code) == self.phone_lengths[code]
+        return False
+    
     def is_positive_response(self, text):
         text_lower = text.lower().strip()
         # Check exact match first for faster processing
@@ -615,6 +854,8 @@ class VoiceBotManager:
     
     def save_visitor_data(self, user_data):
         try:
+            # Seed from the workbook before this row lands in it
+            registration_stats.ensure_loaded()
             user_data['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             user_data['event'] = 'Community Day'
             
@@ -631,6 +872,7 @@ class VoiceBotManager:
                 df_combined = df_new
             
             df_combined.to_excel(EXCEL_FILE, index=False)
+            registration_stats.record(user_data)
             logger.info(f"Visitor data saved: {user_data['name']} - {user_data['company']}")
             
         except Exception as e:
@@ -638,6 +880,145 @@ class VoiceBotManager:
 
 bot_manager = VoiceBotManager()
 
+# Batch replay of recorded utterances (offline QA / extractor tuning)
+BATCH_MAX_RECORDS = int(os.getenv('BATCH_MAX_RECORDS', 50000))
+BATCH_CHUNK_SIZE = 256
+
+def batch_mp_context():
+    """forkserver where available (workers fork from a clean process with this module preloaded), else spawn."""
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([__name__])
+    return context
+
+_replay_manager = None
+
+def _init_replay_worker():
+    global _replay_manager
+    _replay_manager = VoiceBotManager(persist=False)
+
+def replay_record(record):
+    """Run one recorded utterance through the dialogue logic without side effects."""
+    if _replay_manager is None:
+        _init_replay_worker()
+    
+    try:
+        user_input = record.get('user_input', record.get('utterance', ''))
+        state = record.get('conversation_state', record.get('state', 'greeting'))
+        # Partial recordings still need every field the handlers index into
+        user_data = dict(_replay_manager.empty_user_data, **(record.get('user_data') or {}))
+        current_field = record.get('current_field', '')
+        awaiting_confirmation = record.get('awaiting_confirmation', False)
+        
+        result = _replay_manager.process_conversation(
+            user_input, state, user_data, current_field, awaiting_confirmation
+        )
+    except Exception as e:
+        return {'error': str(e)}
+    return result
+
+def score_batch(records, results, elapsed):
+    """Aggregate extraction accuracy and throughput for a replayed batch.
+
+    Records may carry an ``expected`` dict with ``new_state`` and/or a subset
+    of ``updated_data`` fields; only those keys are scored.
+    """
+    errors = 0
+    state_checked = state_correct = 0
+    field_counts = {}
+    
+    for record, result in zip(records, results):
+        if 'error' in result:
+            errors += 1
+        expected = record.get('expected') or {}
+        
+        if 'new_state' in expected:
+            state_checked += 1
+            if result.get('new_state') == expected['new_state']:
+                state_correct += 1
+        
+        actual_data = result.get('updated_data') or {}
+        for field, value in (expected.get('updated_data') or {}).items():
+            counts = field_counts.setdefault(field, {'checked': 0, 'correct': 0})
+            counts['checked'] += 1
+            if actual_data.get(field) == value:
+                counts['correct'] += 1
+    
+    fields_checked = sum(c['checked'] for c in field_counts.values())
+    fields_correct = sum(c['correct'] for c in field_counts.values())
+    
+    return {
+        'records': len(results),
+        'errors': errors,
+        'elapsed_seconds': round(elapsed, 4),
+        'records_per_second': round(len(results) / elapsed, 1) if elapsed > 0 else None,
+        'state_accuracy': round(state_correct / state_checked, 4) if state_checked else None,
+        'extraction_accuracy': round(fields_correct / fields_checked, 4) if fields_checked else None,
+        'field_accuracy': {
+            field: round(c['correct'] / c['checked'], 4)
+            for field, c in sorted(field_counts.items())
+        }
+    }
+
+def run_conversation_batch(records, workers=None):
+    """Replay records across a process pool; returns (results, stats)."""
+    start = time.perf_counter()
+    
+    if workers == 1 or len(records) < BATCH_CHUNK_SIZE:
+        results = [replay_record(record) for record in records]
+    else:
+        chunksize = max(1, min(BATCH_CHUNK_SIZE, len(records) // ((workers or os.cpu_count() or 1) * 4)))
+        # Never fork this process directly: it also runs WebSocket and snapshot threads,
+        # and forking while they hold locks can deadlock the children
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_replay_worker,
+                                 mp_context=batch_mp_context()) as pool:
+            results = list(pool.map(replay_record, records, chunksize=chunksize))
+    
+    elapsed = time.perf_counter() - start
+    return results, score_batch(records, results, elapsed)
+
+def parse_jsonl(lines):
+    records = []
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_no}: {e}")
+        validate_record(record, f"Line {line_no}")
+        records.append(record)
+    return records
+
+def validate_record(record, label):
+    if not isinstance(record, dict):
+        raise ValueError(f"{label} is not a JSON object")
+    for key in ('user_data', 'expected'):
+        if record.get(key) is not None and not isinstance(record[key], dict):
+            raise ValueError(f"{label}: '{key}' must be an object")
+    expected_data = (record.get('expected') or {}).get('updated_data')
+    if expected_data is not None and not isinstance(expected_data, dict):
+        raise ValueError(f"{label}: 'expected.updated_data' must be an object")
+
+def validate_records(records):
+    if not isinstance(records, list):
+        raise ValueError("'records' must be a list")
+    for index, record in enumerate(records):
+        validate_record(record, f"Record {index}")
+    return records
+
+def clamp_workers(workers):
+    """Bound a caller-supplied pool size so a request cannot fork arbitrarily many processes."""
+    if workers is None:
+        return None
+    try:
+        workers = int(workers)
+    except (TypeError, ValueError):
+        raise ValueError("'workers' must be an integer")
+    return max(1, min(workers, os.cpu_count() or 1))
+
 @app.route('/process_conversation', methods=['POST'])
 def process_conversation():
     # Initialize default values
@@ -670,70 +1051,247 @@ def process_conversation():
             'awaiting_confirmation': False
         })
 
-@app.route('/manual_input', methods=['POST'])
-def handle_manual_input():
+@app.route('/intent', methods=['POST'])
+def detect_intent():
     try:
         data = request.json
-        field = data.get('field', '')
-        value = data.get('value', '')
-        user_data = data.get('user_data', {})
+        result = bot_manager.detect_intent(
+            data.get('transcript', ''),
+            data.get('conversation_state', 'greeting'),
+            data.get('current_field', ''),
+            data.get('awaiting_confirmation', False)
+        )
+        return jsonify(result)
         
-        if field and value.strip():
-            user_data[field] = value.strip()
-            
-            # Determine next field
-            field_order = ['name', 'company', 'email', 'phone', 'country']
-            current_index = field_order.index(field)
-            
-            if current_index < len(field_order) - 1:
-                next_field = field_order[current_index + 1]
-                response = f"Thank you! Now, what's your {next_field}?"
-                new_state = f'collect_{next_field}'
-            else:
-                summary = f"Perfect! Let me confirm: Name: {user_data['name']}, Company: {user_data['company']}, Email: {user_data['email']}, Phone: {user_data['phone']}. Should I submit this?"
-                response = summary
-                new_state = 'final_confirmation'
-                next_field = ''
-            
-            return jsonify({
-                'bot_response': response,
-                'new_state': new_state,
-                'updated_data': user_data,
-                'current_field': next_field,
-                'awaiting_confirmation': False
-            })
+    except Exception as e:
+        logger.error(f"Error in intent detection: {e}")
+        return jsonify({'intent': None, 'value': None, 'commit': False})
+
+@app.route('/process_conversation_batch', methods=['POST'])
+def process_conversation_batch():
+    try:
+        # Accept either a JSONL body or {"records": [...]}
+        if request.is_json:
+            data = request.json
+            if not isinstance(data, dict):
+                raise ValueError('Body must be a JSON object with a records list')
+            records = validate_records(data.get('records', []))
+            workers = clamp_workers(data.get('workers'))
         else:
-            return jsonify({
-                'bot_response': f'Please enter a valid {field}.',
-                'new_state': f'collect_{field}',
-                'updated_data': user_data,
-                'current_field': field,
-                'awaiting_confirmation': False
-            })
+            records = parse_jsonl(request.get_data(as_text=True).splitlines())
+            workers = clamp_workers(request.args.get('workers', type=int))
+        
+        if len(records) > BATCH_MAX_RECORDS:
+            return jsonify({'error': f'Batch too large (max {BATCH_MAX_RECORDS} records)'}), 413
+        
+        results, stats = run_conversation_batch(records, workers=workers)
+        
+        if request.args.get('format') == 'jsonl':
+            lines = [json.dumps(result) for result in results]
+            lines.append(json.dumps({'stats': stats}))
+            return app.response_class('\n'.join(lines) + '\n', mimetype='application/x-ndjson')
+        
+        return jsonify({'results': results, 'stats': stats})
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in batch conversation processing: {e}")
+        return jsonify({'error': 'Failed to process batch'}), 500
+
+@app.route('/manual_input', methods=['POST'])
+def handle_manual_input():
+    try:
+        data = request.json
+        result = bot_manager.process_manual_input(
+            data.get('field', ''), data.get('value', ''), data.get('user_data', {})
+        )
+        return jsonify(result)
             
     except Exception as e:
         logger.error(f"Error in manual input: {e}")
         return jsonify({'error': 'Failed to process manual input'}), 500
 
+# Admission control for Polly: keeps one runaway kiosk from exhausting the account's TPS quota
+TTS_MAX_TEXT_LENGTH = int(os.getenv('TTS_MAX_TEXT_LENGTH', 1500))
+TTS_GLOBAL_RATE = float(os.getenv('TTS_GLOBAL_RATE', 8))
+TTS_GLOBAL_BURST = float(os.getenv('TTS_GLOBAL_BURST', 10))
+TTS_CLIENT_RATE = float(os.getenv('TTS_CLIENT_RATE', 1))
+TTS_CLIENT_BURST = float(os.getenv('TTS_CLIENT_BURST', 4))
+TTS_MAX_CONCURRENCY = int(os.getenv('TTS_MAX_CONCURRENCY', 8))
+TTS_QUEUE_TIMEOUT = float(os.getenv('TTS_QUEUE_TIMEOUT', 2.0))
+TTS_ALLOWED_VOICES = set(os.getenv('TTS_ALLOWED_VOICES', 'Matthew,Joanna,Kajal,Amy,Brian,Olivia').split(','))
+TTS_FALLBACK_TEXT = "Sorry, I'm a little busy right now. Please give me a moment and try again."
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens >= 1
+    
+    def take(self):
+        self.tokens -= 1
+
+class SpeechAdmission:
+    """Per-client and global token buckets plus a bounded Polly concurrency slot."""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.global_bucket = TokenBucket(TTS_GLOBAL_RATE, TTS_GLOBAL_BURST)
+        self.client_buckets = {}
+        self.slots = threading.BoundedSemaphore(TTS_MAX_CONCURRENCY)
+        self.fallback_audio = {}
+        self.in_flight = 0
+        self.counters = {
+            'requests': 0, 'admitted': 0, 'rejected_text_length': 0, 'rejected_voice': 0,
+            'rate_limited_client': 0, 'rate_limited_global': 0, 'shed_queue_timeout': 0,
+            'fallback_served': 0, 'polly_errors': 0, 'peak_in_flight': 0
+        }
+    
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+    
+    def validate(self, text, voice):
+        """Return an error message for requests Polly should never see, else None."""
+        self.count('requests')
+        if not text or len(text) > TTS_MAX_TEXT_LENGTH:
+            self.count('rejected_text_length')
+            return f'Text must be 1-{TTS_MAX_TEXT_LENGTH} characters'
+        if voice not in TTS_ALLOWED_VOICES:
+            self.count('rejected_voice')
+            return f'Unsupported voice: {voice}'
+        return None
+    
+    def check_rate(self, client_id):
+        """Return the name of the exhausted bucket, or None when the request may proceed."""
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.client_buckets.get(client_id)
+            if bucket is None:
+                if len(self.client_buckets) > 1000:
+                    self.prune(now)
+                bucket = self.client_buckets[client_id] = TokenBucket(TTS_CLIENT_RATE, TTS_CLIENT_BURST)
+            # Check both before spending from either, so a drained global bucket
+            # does not also drain every client's own allowance
+            if not bucket.refill(now):
+                self.counters['rate_limited_client'] += 1
+                return 'client'
+            if not self.global_bucket.refill(now):
+                self.counters['rate_limited_global'] += 1
+                return 'global'
+            bucket.take()
+            self.global_bucket.take()
+            return None
+    
+    def prune(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        idle = [cid for cid, bucket in self.client_buckets.items()
+                if (now - bucket.updated) * bucket.rate + bucket.tokens >= bucket.capacity]
+        for cid in idle:
+            del self.client_buckets[cid]
+    
+    def acquire(self):
+        if not self.slots.acquire(timeout=TTS_QUEUE_TIMEOUT):
+            self.count('shed_queue_timeout')
+            return False
+        with self.lock:
+            self.counters['admitted'] += 1
+            self.in_flight += 1
+            self.counters['peak_in_flight'] = max(self.counters['peak_in_flight'], self.in_flight)
+        return True
+    
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+    
+    def warm_fallback(self):
+        """Synthesize the 'busy' prompt for every allowed voice; call once at startup."""
+        if not polly_client:
+            return
+        for voice in sorted(TTS_ALLOWED_VOICES):
+            try:
+                self.fallback_audio[voice] = synthesize_speech(TTS_FALLBACK_TEXT, voice).read()
+            except Exception as e:
+                logger.error(f"Error synthesizing fallback prompt for {voice}: {e}")
+    
+    def fallback(self, voice):
+        """Cached 'busy' prompt; never calls Polly, since shedding means Polly is saturated."""
+        audio = self.fallback_audio.get(voice) or next(iter(self.fallback_audio.values()), None)
+        if audio:
+            self.count('fallback_served')
+        return audio
+    
+    def stats(self):
+        with self.lock:
+            return dict(
+                self.counters,
+                in_flight=self.in_flight,
+                tracked_clients=len(self.client_buckets),
+                limits={
+                    'max_text_length': TTS_MAX_TEXT_LENGTH,
+                    'global_rate': TTS_GLOBAL_RATE, 'global_burst': TTS_GLOBAL_BURST,
+                    'client_rate': TTS_CLIENT_RATE, 'client_burst': TTS_CLIENT_BURST,
+                    'max_concurrency': TTS_MAX_CONCURRENCY, 'queue_timeout': TTS_QUEUE_TIMEOUT
+                }
+            )
+
+speech_admission = SpeechAdmission()
+
+def synthesize_speech(text, voice):
+    """Return Polly's streaming MP3 body for text."""
+    response = polly_client.synthesize_speech(
+        Text=text,
+        OutputFormat='mp3',
+        VoiceId=voice,
+        Engine='neural'
+    )
+    return response['AudioStream']
+
+def fallback_response(voice, error, status):
+    audio = speech_admission.fallback(voice)
+    payload = {'error': error, 'fallback': True}
+    if audio:
+        payload['audio_base64'] = base64.b64encode(audio).decode('utf-8')
+    return jsonify(payload), status, {'Retry-After': '1'}
+
 @app.route('/chat', methods=['POST'])
 def handle_chat():
     try:
         data = request.json
         text = data.get('text', '')
         voice = data.get('voice', 'Matthew')
+        client_id = request.headers.get('X-Client-Id') or request.remote_addr
         
         if not polly_client:
             return jsonify({'error': 'Text-to-speech service unavailable'}), 503
         
-        # Direct Polly synthesis for faster response
-        response = polly_client.synthesize_speech(
-            Text=text,
-            OutputFormat='mp3',
-            VoiceId=voice,
-            Engine='neural'
-        )
+        error = speech_admission.validate(text, voice)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        if speech_admission.check_rate(client_id):
+            return fallback_response(voice, 'Too many speech requests', 429)
+        
+        if not speech_admission.acquire():
+            return fallback_response(voice, 'Speech service busy', 503)
+        
+        try:
+            # Direct Polly synthesis for faster response
+            audio_bytes = synthesize_speech(text, voice).read()
+        except Exception:
+            speech_admission.count('polly_errors')
+            raise
+        finally:
+            speech_admission.release()
         
-        audio_bytes = response['AudioStream'].read()
         audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
         
         return jsonify({
@@ -744,10 +1302,314 @@ def handle_chat():
         logger.error(f"Error in text-to-speech: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/chat/stats', methods=['GET'])
+def chat_stats():
+    return jsonify(speech_admission.stats())
+
+@app.route('/stats', methods=['GET'])
+def registration_summary():
+    return jsonify(registration_stats.summary(top=request.args.get('top', type=int)))
+
+# Persistent per-kiosk session channel
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', 600))
+AUDIO_CHUNK_SIZE = 16 * 1024
+
+class SessionStore:
+    """Server-side conversation state, kept across reconnects for SESSION_TTL_SECONDS.
+
+    All writes to a session dict go through these methods and hold self.lock.
+    """
+    
+    def __init__(self, ttl=SESSION_TTL_SECONDS):
+        self.ttl = ttl
+        self.sessions = {}
+        self.lock = threading.Lock()
+    
+    def open(self, session_id=None, voice=None, tts=None):
+        """Resume session_id if it is still live, otherwise start a new session."""
+        now = time.time()
+        with self.lock:
+            self.expire(now)
+            session = self.sessions.get(session_id) if session_id else None
+            resumed = session is not None
+            if not resumed:
+                session = self.new_session()
+                self.sessions[session['session_id']] = session
+            # A newer connection takes over; the old one stops being served
+            session['connection_id'] = uuid.uuid4().hex
+            session['last_seen'] = now
+            if voice is not None:
+                session['voice'] = voice
+            if tts is not None:
+                session['tts'] = tts
+            return session, resumed
+    
+    def new_session(self):
+        return {
+            'session_id': uuid.uuid4().hex,
+            'state': 'greeting',
+            'user_data': bot_manager.empty_user_data.copy(),
+            'current_field': '',
+            'awaiting_confirmation': False,
+            'turn': 0,
+            'last_bot_response': '',
+            'voice': 'Matthew',
+            'tts': True,
+            'connection_id': None,
+            'last_seen': time.time()
+        }
+    
+    def reset(self, session):
+        with self.lock:
+            fresh = self.new_session()
+            for key in ('state', 'user_data', 'current_field', 'awaiting_confirmation', 'last_bot_response'):
+                session[key] = fresh[key]
+            session['turn'] += 1
+    
+    def commit(self, session, result):
+        """Apply a processed turn and return the new turn number."""
+        with self.lock:
+            session['state'] = result['new_state']
+            session['user_data'] = result['updated_data']
+            session['current_field'] = result.get('current_field', '')
+            session['awaiting_confirmation'] = result.get('awaiting_confirmation', False)
+            session['last_bot_response'] = result['bot_response']
+            session['turn'] += 1
+            return session['turn']
+    
+    def sync(self, session, state):
+        with self.lock:
+            session['state'] = state.get('conversation_state', session['state'])
+            if 'user_data' in state:
+                # Handlers index every field, so a partial client copy is filled from the defaults
+                session['user_data'] = dict(bot_manager.empty_user_data, **state['user_data'])
+            session['current_field'] = state.get('current_field', session['current_field'])
+            session['awaiting_confirmation'] = state.get('awaiting_confirmation', session['awaiting_confirmation'])
+    
+    def touch(self, session):
+        with self.lock:
+            session['last_seen'] = time.time()
+    
+    def expire(self, now):
+        stale = [sid for sid, session in self.sessions.items() if now - session['last_seen'] > self.ttl]
+        for sid in stale:
+            del self.sessions[sid]
+    
+    def stats(self):
+        with self.lock:
+            self.expire(time.time())
+            return {'sessions': len(self.sessions), 'ttl_seconds': self.ttl}
+
+session_store = SessionStore()
+
+@app.route('/session/stats', methods=['GET'])
+def session_stats():
+    return jsonify(session_store.stats())
+
+def session_snapshot(session):
+    return {
+        'session_id': session['session_id'],
+        'conversation_state': session['state'],
+        'user_data': session['user_data'],
+        'current_field': session['current_field'],
+        'awaiting_confirmation': session['awaiting_confirmation'],
+        'turn': session['turn'],
+        'last_bot_response': session['last_bot_response']
+    }
+
+def send_json(ws, payload):
+    ws.send(json.dumps(payload))
+
+def commit_turn(ws, session, result, user_input):
+    turn = session_store.commit(session, result)
+    
+    # Bot text goes out first so the client can render while audio is synthesized
+    send_json(ws, dict(result, type='turn', turn=turn, user_input=user_input))
+    stream_audio(ws, session, result['bot_response'], turn)
+
+def stream_audio(ws, session, text, turn):
+    if not session['tts']:
+        return
+    if not polly_client:
+        send_json(ws, {'type': 'audio_error', 'turn': turn, 'error': 'Text-to-speech service unavailable'})
+        return
+    
+    voice = session['voice']
+    error = speech_admission.validate(text, voice)
+    if error:
+        send_json(ws, {'type': 'audio_error', 'turn': turn, 'error': error})
+        return
+    
+    if speech_admission.check_rate(session['session_id']) or not speech_admission.acquire():
+        send_audio(ws, speech_admission.fallback(voice), turn, fallback=True)
+        return
+    
+    try:
+        audio_stream = synthesize_speech(text, voice)
+        send_json(ws, {'type': 'audio_start', 'turn': turn, 'format': 'mp3'})
+        for chunk in audio_stream.iter_chunks(AUDIO_CHUNK_SIZE):
+            ws.send(chunk)
+        send_json(ws, {'type': 'audio_end', 'turn': turn})
+    except ConnectionClosed:
+        raise
+    except Exception as e:
+        speech_admission.count('polly_errors')
+        logger.error(f"Error streaming audio: {e}")
+        send_json(ws, {'type': 'audio_error', 'turn': turn, 'error': 'Failed to synthesize speech'})
+    finally:
+        speech_admission.release()
+
+def send_audio(ws, audio, turn, fallback=False):
+    if not audio:
+        send_json(ws, {'type': 'audio_error', 'turn': turn, 'error': 'Speech service busy'})
+        return
+    send_json(ws, {'type': 'audio_start', 'turn': turn, 'format': 'mp3', 'fallback': fallback})
+    for offset in range(0, len(audio), AUDIO_CHUNK_SIZE):
+        ws.send(audio[offset:offset + AUDIO_CHUNK_SIZE])
+    send_json(ws, {'type': 'audio_end', 'turn': turn})
+
+# Expected field types per client message; anything else is answered with an error frame
+SESSION_MESSAGE_FIELDS = {
+    'hello': {'session_id': (str, type(None)), 'voice': str, 'tts': bool},
+    'transcript': {'text': str, 'final': bool, 'turn': int},
+    'manual_input': {'field': str, 'value': str},
+    'say': {'text': str},
+    'sync': {'conversation_state': str, 'user_data': dict, 'current_field': str, 'awaiting_confirmation': bool}
+}
+
+def validate_session_message(message):
+    """Return an error message for malformed frames, else None."""
+    if not isinstance(message, dict):
+        return 'Messages must be JSON objects'
+    for field, types in SESSION_MESSAGE_FIELDS.get(message.get('type'), {}).items():
+        if field in message and not isinstance(message[field], types):
+            return f"Invalid '{field}' for {message['type']} message"
+    return None
+
+def handle_transcript(ws, session, message):
+    text = message.get('text', '').strip()
+    final = message.get('final', True)
+    # Transcripts for a turn that has already been committed are stale; a final one
+    # still gets a reply because the client has stopped listening and is waiting
+    if not text or message.get('turn', session['turn']) != session['turn']:
+        if final:
+            send_json(ws, {'type': 'stale', 'turn': session['turn']})
+        return
+    
+    if not final:
+        intent = bot_manager.detect_intent(
+            text, session['state'], session['current_field'], session['awaiting_confirmation']
+        )
+        if not intent['commit']:
+            return
+    
+    try:
+        result = bot_manager.process_conversation(
+            text, session['state'], dict(session['user_data']),
+            session['current_field'], session['awaiting_confirmation']
+        )
+    except Exception as e:
+        logger.error(f"Error in conversation processing: {e}")
+        apology = 'I apologize, there was an error. Could you please repeat that?'
+        send_json(ws, {
+            'type': 'turn',
+            'turn': session['turn'],
+            'user_input': text,
+            'bot_response': apology,
+            'new_state': session['state'],
+            'updated_data': session['user_data'],
+            'current_field': session['current_field'],
+            'awaiting_confirmation': False
+        })
+        # The client waits for audio after every turn frame before listening again
+        stream_audio(ws, session, apology, session['turn'])
+        return
+    commit_turn(ws, session, result, text)
+
+def handle_session_manual_input(ws, session, message):
+    field = message.get('field', '')
+    value = message.get('value', '')
+    try:
+        result = bot_manager.process_manual_input(field, value, dict(session['user_data']))
+    except Exception as e:
+        logger.error(f"Error in manual input: {e}")
+        send_json(ws, {'type': 'error', 'error': 'Failed to process manual input'})
+        return
+    commit_turn(ws, session, result, value)
+
+@sock.route('/session')
+def session_channel(ws):
+    """Duplex kiosk channel.
+
+    Client messages: hello {session_id?, voice?, tts?}, transcript {text, final, turn},
+    manual_input {field, value}, say {text}, sync {conversation_state, user_data, ...},
+    reset, ping.
+    Server messages: session, synced, turn, stale, audio_start, binary MP3 chunks,
+    audio_end, audio_error, pong, error.
+    """
+    session = None
+    connection_id = None
+    try:
+        while True:
+            raw = ws.receive()
+            if session and session['connection_id'] != connection_id:
+                send_json(ws, {'type': 'error', 'error': 'Session resumed elsewhere'})
+                break
+            
+            try:
+                message = json.loads(raw)
+            except (TypeError, ValueError):
+                send_json(ws, {'type': 'error', 'error': 'Messages must be JSON text frames'})
+                continue
+            
+            error = validate_session_message(message)
+            if error:
+                send_json(ws, {'type': 'error', 'error': error})
+                continue
+            
+            msg_type = message.get('type')
+            
+            if msg_type == 'hello':
+                session, resumed = session_store.open(
+                    message.get('session_id'), message.get('voice'), message.get('tts')
+                )
+                connection_id = session['connection_id']
+                send_json(ws, dict(session_snapshot(session), type='session', resumed=resumed))
+                continue
+            
+            if session is None:
+                send_json(ws, {'type': 'error', 'error': 'Send hello first'})
+                continue
+            
+            session_store.touch(session)
+            
+            if msg_type == 'ping':
+                send_json(ws, {'type': 'pong', 'turn': session['turn'], 'server_time': time.time()})
+            elif msg_type == 'transcript':
+                handle_transcript(ws, session, message)
+            elif msg_type == 'manual_input':
+                handle_session_manual_input(ws, session, message)
+            elif msg_type == 'say':
+                # Bot-initiated prompts (welcome, restart hints) reuse the audio path
+                stream_audio(ws, session, message.get('text', ''), session['turn'])
+            elif msg_type == 'sync':
+                # Client advanced over the HTTP fallback while disconnected
+                session_store.sync(session, message)
+                send_json(ws, dict(session_snapshot(session), type='synced'))
+            elif msg_type == 'reset':
+                session_store.reset(session)
+                send_json(ws, dict(session_snapshot(session), type='session', resumed=False))
+            else:
+                send_json(ws, {'type': 'error', 'error': f'Unknown message type: {msg_type}'})
+    finally:
+        if session:
+            session_store.touch(session)
+
 # Removed Bedrock enhancement for faster processing
 
 if __name__ == '__main__':
     debug_mode = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     host = os.getenv('FLASK_HOST', '127.0.0.1')
     port = int(os.getenv('FLASK_PORT', 5000))
+    speech_admission.warm_fallback()
     app.run(debug=debug_mode, host=host, port=port)
\ No newline at end of file